@@ -1,10 +1,15 @@
 # filename: autogen_discord_bot.py
 from __future__ import annotations
-import asyncio, builtins, logging, os, re, shlex, subprocess, sys, textwrap, getpass, platform, random
+import asyncio, atexit, builtins, hashlib, io, logging, os, re, shlex, shutil, subprocess, sys, tempfile, textwrap, getpass, platform, weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any
 import prompts.system as system_prompt_module
 import prompts.webfgapp as webfg_app_prompt_module
+from response_cache import ExactResponseCache, SemanticResponseCache
+from streaming_chat import looks_conversational, stream_completion
+from chat_utils import HistoryWindow, chunk_text
 
 # ── basic setup ──────────────────────────────────────────────────────────────
 builtins.input = lambda *_: ""  # prevent stdin blocking
@@ -69,11 +74,10 @@ if not USE_GEMINI and not OPENAI_API_KEY:
 MAX_RECOVERY_ATTEMPTS = 3 # Total attempts: 1 initial + (MAX_RECOVERY_ATTEMPTS - 1) retries
 
 if USE_GEMINI:
-    from gemini_retry_wrapper import GeminiRetryWrapper
+    import gemini_retry_wrapper as _grw # module handle also needed for MAX_TOTAL_TOKENS
     import autogen.oai.gemini as _gm_autogen # Renamed to avoid conflict with _grw
-    _gm_autogen.GeminiClient = _gm_autogen.Gemini = GeminiRetryWrapper
-    GeminiRetryWrapper._KEYS = GEMINI_API_KEYS
-    import gemini_retry_wrapper as _grw # Import the module itself as _grw for MAX_TOTAL_TOKENS
+    _gm_autogen.GeminiClient = _gm_autogen.Gemini = _grw.GeminiRetryWrapper
+    _grw.GeminiRetryWrapper._KEYS = GEMINI_API_KEYS
     _LOG.info("✅ GeminiRetryWrapper and _grw module configured.")
 
 # ---------------------------------------------------------------------------
@@ -82,6 +86,7 @@ if USE_GEMINI:
 import autogen
 from autogen.coding import LocalCommandLineCodeExecutor, CodeBlock
 from autogen.coding.base import CommandLineCodeResult # Try importing from base
+from autogen.coding.utils import silence_pip
 import discord
 
 # --- Monkey-patching to disable command sanitization ---
@@ -101,152 +106,170 @@ _LOG.warning("⚠️ Monkey-patched LocalCommandLineCodeExecutor.sanitize_comman
 # 5) Enhanced Executor with Logging
 # ---------------------------------------------------------------------------
 # --- add this helper inside your module (keep log object) -------------------
+LARGE_BASH_OUTPUT_TAIL = 1_000_000   # bytes of script output handed back to the agent
+_BASH = shutil.which("bash") or "/bin/bash"   # resolved once, not a PATH search per exec
+# RAM-backed tmpfs for the throwaway script when available – writing it is then
+# a page-cache copy with no disk I/O. (Output still spools to the regular tmp
+# dir: it can be far larger than the script.)
+_SCRIPT_DIR = "/dev/shm" if os.access("/dev/shm", os.W_OK | os.X_OK) else None
+
 def _run_large_bash(code: str, work_dir: Path, timeout: int) -> CommandLineCodeResult:
     """
     Write long bash code to a temp file and execute it to bypass ARG_MAX.
     Returns a CommandLineCodeResult compatible with AutoGen.
     """
-    with tempfile.NamedTemporaryFile("w", delete=False, suffix=".sh", dir=work_dir) as fh:
-        fh.write(textwrap.dedent(code))
-        tmp_script = Path(fh.name)
-    os.chmod(tmp_script, 0o755)
-
-    proc = subprocess.run(
-        ["bash", str(tmp_script)],
-        cwd=work_dir,
-        text=True,
-        capture_output=True,
-        timeout=timeout,
-    )
-    # cleanup if you like: tmp_script.unlink(missing_ok=True)
-    return CommandLineCodeResult(
-        exit_code=proc.returncode,
-        output=proc.stdout + proc.stderr,
-    )
+    # raw fd + os.write: no buffered file object, and no chmod – bash is invoked
+    # explicitly, so the script never needs the exec bit
+    fd, name = tempfile.mkstemp(suffix=".sh", dir=_SCRIPT_DIR or work_dir)
+    try:
+        data = memoryview(textwrap.dedent(code).encode())
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+    tmp_script = Path(name)
+
+    # Spool stdout+stderr (interleaved, as a terminal would show them) to an
+    # anonymous file instead of pipes: a chatty script can't grow our RSS, and
+    # only the last LARGE_BASH_OUTPUT_TAIL bytes are read back for the agent.
+    with tempfile.TemporaryFile() as out:
+        try:
+            proc = subprocess.Popen((_BASH, name), cwd=work_dir, stdout=out, stderr=subprocess.STDOUT)
+            try:
+                exit_code = proc.wait(timeout=timeout)
+                note = ""
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                exit_code, note = 124, f"\n[killed after {timeout}s timeout]"
+        finally:
+            tmp_script.unlink(missing_ok=True)  # don't accumulate one script per call in work_dir
+        size = out.seek(0, os.SEEK_END)
+        out.seek(max(0, size - LARGE_BASH_OUTPUT_TAIL))
+        output = out.read().decode("utf-8", errors="replace")
+    if size > LARGE_BASH_OUTPUT_TAIL:
+        output = f"[... {size - LARGE_BASH_OUTPUT_TAIL} bytes of earlier output dropped ...]\n" + output
+    return CommandLineCodeResult(exit_code=exit_code, output=output + note)
 # ---------------------------------------------------------------------------
 
+# Expanded list of common languages (module-level frozenset: built once, hashed lookups)
+KNOWN_LANGUAGES = frozenset({
+    # Shells
+    "bash", "shell", "sh", "zsh", "ksh", "fish",
+    # Scripting
+    "python", "python3", "py",
+    "javascript", "js", "nodejs", "node",
+    "typescript", "ts",
+    "ruby", "rb",
+    "perl", "pl",
+    "php",
+    "lua",
+    "groovy",
+    # PowerShell
+    "powershell", "pwsh", "ps1",
+    # Web
+    "html", "htm",
+    "css",
+    "json",
+    "yaml", "yml",
+    "xml",
+    # Compiled
+    "c", "cpp", "c++",
+    "java",
+    "csharp", "cs",
+    "go", "golang",
+    "rust", "rs",
+    "swift",
+    "kotlin", "kt",
+    "scala",
+    "objective-c", "objc",
+    # Data/DB
+    "sql",
+    "r",
+    # Other
+    "makefile",
+    "dockerfile",
+    "markdown", "md",
+    "text", "txt", "", # Allow empty language tag as plain text/default shell
+    # Add any other languages frequently encountered by the agent
+})
+_BASH_LANGS = frozenset({"bash", "shell", "sh"})   # blocks that get the ARG_MAX handling
+
 class EnhancedLocalExecutor(LocalCommandLineCodeExecutor):
-    ARG_MAX_SAFETY = 1_500_000        # bytes – stay below kernel limit
     # No longer need the sanitize_command override here, as the base class is patched.
-    # Expanded list of common languages
-    KNOWN_LANGUAGES = {
-        # Shells
-        "bash", "shell", "sh", "zsh", "ksh", "fish",
-        # Scripting
-        "python", "python3", "py",
-        "javascript", "js", "nodejs", "node",
-        "typescript", "ts",
-        "ruby", "rb",
-        "perl", "pl",
-        "php",
-        "lua",
-        "groovy",
-        # PowerShell
-        "powershell", "pwsh", "ps1",
-        # Web
-        "html", "htm",
-        "css",
-        "json",
-        "yaml", "yml",
-        "xml",
-        # Compiled
-        "c", "cpp", "c++",
-        "java",
-        "csharp", "cs",
-        "go", "golang",
-        "rust", "rs",
-        "swift",
-        "kotlin", "kt",
-        "scala",
-        "objective-c", "objc",
-        # Data/DB
-        "sql",
-        "r",
-        # Other
-        "makefile",
-        "dockerfile",
-        "markdown", "md",
-        "text", "txt", "", # Allow empty language tag as plain text/default shell
-        # Add any other languages frequently encountered by the agent
-    }
 
-    HEARTBEAT_SEC = 10               # how often to print a dot
-    ARG_MAX_SAFETY = 1_500_000
+    ARG_MAX_SAFETY = 1_500_000       # bytes – stay below kernel limit
 
-    def _wrap_with_heartbeat(self, script: str) -> str:
+    def _remove_code_file(self, code: str, language: str) -> None:
         """
-        Prefix a bash script with a background heartbeat that prints one dot
-        every HEARTBEAT_SEC seconds until the script exits.
+        The parent writes every block to work_dir/tmp_code_<md5>.<ext> and never
+        deletes it, so HOME_DIR filled up with one file per command ever run.
         """
-        return textwrap.dedent(f"""
-            # ---- auto‑heartbeat injected by EnhancedLocalExecutor ----
-            ( while true; do printf '.'; sleep {self.HEARTBEAT_SEC}; done ) &
-            __HB_PID=$!
-            trap 'kill "$__HB_PID" 2>/dev/null' EXIT
-            # ----------------------------------------------------------
-            {script}
-        """)
-
+        # the parent hashes the code *after* silence_pip() has added -qqq to any
+        # pip install line, so hash the same text or the file is never found
+        prefix = f"tmp_code_{hashlib.md5(silence_pip(code, language).encode()).hexdigest()}."
+        # one scandir pass with a plain prefix test – no Path object or fnmatch per entry
+        with os.scandir(self.work_dir) as it:
+            stale = [entry.path for entry in it if entry.name.startswith(prefix)]
+        for path in stale:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
 
     def execute_code_blocks(self, code_blocks: List[CodeBlock]) -> CommandLineCodeResult:
         """Executes code blocks with enhanced logging and unknown language handling."""
-        log_messages = []
-        exit_codes = []
+        failed = False   # any block skipped, errored or exited non-zero
         outputs = []
         for block in code_blocks:
             language = block.language.lower()
             code = block.code
 
-            _LOG.debug(f"Attempting execution for language '{language}':\n---\n{code}\n---")
+            # %-style args: at the default INFO level the script isn't copied into a string
+            _LOG.debug("Attempting execution for language %r:\n---\n%s\n---", language, code)
 
-            if language not in self.KNOWN_LANGUAGES:
+            if language not in KNOWN_LANGUAGES:
                 # Format the skip message to include the command clearly for the agent output
                 skip_output = f"Skipped command (unknown language '{language}'):\n```\n{code}\n```"
                 _LOG.warning(skip_output)
                 # Append a non-zero exit code and the formatted skip message as output
-                exit_codes.append(1) # Indicate failure/skip
+                failed = True # Indicate failure/skip
                 outputs.append(skip_output) # Add formatted skip message to outputs
-                log_messages.append(skip_output) # Also log it
                 continue # Skip to the next block
 
             # Execute known language block using the parent method for a single block
             # This assumes the parent method can handle a list with one item.
             try:
-                if language in {"bash", "shell", "sh"}:
-                    code = self._wrap_with_heartbeat(code)
-                if language in {"bash", "shell", "sh"} and len(code.encode()) > self.ARG_MAX_SAFETY:
+                # UTF-8 is at most 4 bytes/char, so only a script that *could* exceed
+                # the limit pays for encoding a full copy just to measure it
+                if (language in _BASH_LANGS and len(code) * 4 > self.ARG_MAX_SAFETY
+                        and len(code.encode()) > self.ARG_MAX_SAFETY):
                     _LOG.info("Large bash snippet detected – executing via temp script to avoid ARG_MAX")
                     return _run_large_bash(code, self.work_dir, self.timeout)
                 # We call the super method with a list containing only the current block
                 # single_block_result: CommandLineCodeResult = super().execute_code_blocks([block])
-                single_block_result: CommandLineCodeResult = super().execute_code_blocks(
-                    [CodeBlock(language=block.language, code=code)]
-                )
-                _LOG.debug(f"Execution result (Exit Code {single_block_result.exit_code}):\n---\n{single_block_result.output}\n---")
-                exit_codes.append(single_block_result.exit_code)
+                try:
+                    single_block_result: CommandLineCodeResult = super().execute_code_blocks([block])
+                finally:
+                    self._remove_code_file(code, language)
+                _LOG.debug("Execution result (Exit Code %s):\n---\n%s\n---", single_block_result.exit_code, single_block_result.output)
+                failed |= single_block_result.exit_code != 0
                 # Prepend the executed code to the output for the agent
                 formatted_output = f"Executed command:\n```\n{code}\n```\nOutput:\n{single_block_result.output}"
                 outputs.append(formatted_output)
-                # Assuming log file path might be in the result, or construct one if needed
-                # For simplicity, we'll just use the output as the log message here.
-                # Update log message to use 'language'
-                log_messages.append(f"Executed {language} block. Exit Code: {single_block_result.exit_code}\nOutput:\n{single_block_result.output}") # Keep log simple
             except Exception as e:
                 # Update error message to use 'language' and include code for agent output
                 error_output = f"Error executing command:\n```\n{code}\n```\nError:\n{e}"
                 _LOG.error(f"Error executing {language} block: {e}\nCode:\n---\n{code}\n---", exc_info=True) # Keep detailed log
-                exit_codes.append(1) # Indicate failure
+                failed = True # Indicate failure
                 outputs.append(error_output) # Add formatted error to outputs
-                log_messages.append(error_output) # Also log it
 
 
         # Combine results. We need to decide how to aggregate exit codes.
         # Let's return 0 only if all blocks succeeded (exit code 0).
-        final_exit_code = 0
-        if any(ec != 0 for ec in exit_codes):
-            final_exit_code = 1 # Or perhaps the first non-zero exit code? Let's use 1 for simplicity.
+        final_exit_code = 1 if failed else 0 # Or perhaps the first non-zero exit code? Let's use 1 for simplicity.
 
-        # Combine outputs and log messages
+        # Combine outputs – a single join is already linear in the total size
         final_output = "\n---\n".join(outputs)
         # The original CommandLineCodeResult might have a specific log file.
         # We are creating a synthetic result here. Adjust if the actual class structure differs.
@@ -272,75 +295,377 @@ _LOG.info("✅ Loaded system prompt with, BOT_USER=" + BOT_USER + " HOME_DIR=" +
 
 header = textwrap.dedent(webfg_app_prompt_module.WEBFG_APP_PROMPT()).strip()
 
+# Built exactly once: the system message is the static prefix of every request,
+# and keeping it byte-identical is what lets provider-side prefix caching hit.
+SYSTEM_MESSAGE = base_system_prompt + "\n\n" + header
+
 # ---------------------------------------------------------------------------
 # 6) LLM config
 # ---------------------------------------------------------------------------
+# fullmatch rejects an ordinary (possibly huge) message after a few characters,
+# where .strip().upper() would copy the whole content twice on every turn
+_TERMINATE_RE = re.compile(r"\s*(?:TERMINATE|DONE)\s*", re.IGNORECASE)
+
 def only_assistant_can_end(msg: dict) -> bool:
     """
     Return True only when the *assistant* sends TERMINATE or DONE.
     """
     return (
         msg.get("name") == BOT_USER           # assistant’s name
-        and msg.get("content", "").strip().upper() in {"TERMINATE", "DONE"}
+        and _TERMINATE_RE.fullmatch(msg.get("content") or "") is not None
     )
 
-llm_config = {
-    "temperature": 0.7,
-    "cache_seed": None,
-    "config_list": [{
-        "model": "gemini-2.5-pro-exp-03-25" if USE_GEMINI else "gpt-3.5-turbo",
-        "api_key": random.choice(GEMINI_API_KEYS) if USE_GEMINI else OPENAI_API_KEY,
-        "api_type": "google" if USE_GEMINI else "openai",
-    }],
-}
-assistant = autogen.AssistantAgent(
-    name=BOT_USER,
-    llm_config=llm_config,
-    system_message=base_system_prompt + "\\n\\n" + header
-)
-user_proxy = autogen.UserProxyAgent(
-    name="user_proxy",
-    human_input_mode="NEVER",
-    max_consecutive_auto_reply=500,
-    default_auto_reply='TERMINATE',
-    is_termination_msg=only_assistant_can_end,
-    code_execution_config={"executor": executor},
+HISTORY_WINDOW_MAX = int(os.getenv("HISTORY_WINDOW_MAX", "200"))   # 0 disables windowing
+HISTORY_WINDOW_KEEP = int(os.getenv("HISTORY_WINDOW_KEEP", str(HISTORY_WINDOW_MAX // 2)))
+
+# Cheap-first routing: when FAST_MODEL is set every request goes to it first and is
+# escalated to STRONG_MODEL only if it asks to be (or produced nothing at all).
+STRONG_MODEL = os.getenv("STRONG_MODEL") or ("gemini-2.5-pro-exp-03-25" if USE_GEMINI else "gpt-3.5-turbo")
+FAST_MODEL = os.getenv("FAST_MODEL", "")            # e.g. gemini-2.0-flash / gpt-4o-mini; empty = off
+ESCALATE_WORD = "ESCALATE"
+
+# Round-robin over the keys; GeminiRetryWrapper owns the rotation and the cooldown
+# of rejected keys, so the streaming path draws from the same pool.
+def _next_gemini_key() -> str:
+    return _grw.GeminiRetryWrapper.next_key() or GEMINI_API_KEYS[0]
+
+def _make_llm_config(model: str) -> dict:
+    return {
+        "temperature": 0.7,
+        "cache_seed": None,
+        "config_list": [{
+            "model": model,
+            # GeminiRetryWrapper ignores this and picks its own key from the pool
+            "api_key": GEMINI_API_KEYS[0] if USE_GEMINI else OPENAI_API_KEY,
+            "api_type": "google" if USE_GEMINI else "openai",
+        }],
+    }
+
+def _make_assistant(model: str, system_message: str) -> autogen.AssistantAgent:
+    agent = autogen.AssistantAgent(
+        name=BOT_USER,
+        llm_config=_make_llm_config(model),
+        system_message=system_message,
+    )
+    if HISTORY_WINDOW_MAX > 0:
+        agent.register_hook(
+            "process_all_messages_before_reply",
+            HistoryWindow(HISTORY_WINDOW_MAX, min(HISTORY_WINDOW_KEEP, HISTORY_WINDOW_MAX)),
+        )
+    return agent
+
+# Post the assistant's intermediate turns to Discord while a long chat runs
+ENABLE_PROGRESS_MESSAGES = os.getenv("ENABLE_PROGRESS_MESSAGES", "false").lower() == "true"
+
+FAST_SYSTEM_MESSAGE = (
+    SYSTEM_MESSAGE + f"\n\nIf a task is beyond your abilities, reply with exactly {ESCALATE_WORD} and nothing else."
 )
+if FAST_MODEL:
+    _LOG.info(f"✅ Cheap-first routing enabled: {FAST_MODEL} → {STRONG_MODEL}.")
+
+class _AgentSession:
+    """
+    One Discord channel's agents. Their chat history *is* that channel's
+    conversation, so channels no longer share (and serialise on) one global
+    assistant/user_proxy pair. The code executor is stateless and shared.
+    """
+    def __init__(self):
+        self.assistant = _make_assistant(STRONG_MODEL, SYSTEM_MESSAGE)
+        self.assistant_fast = _make_assistant(FAST_MODEL, FAST_SYSTEM_MESSAGE) if FAST_MODEL else None
+        self.user_proxy = autogen.UserProxyAgent(
+            name="user_proxy",
+            human_input_mode="NEVER",
+            max_consecutive_auto_reply=500,
+            default_auto_reply='TERMINATE',
+            is_termination_msg=only_assistant_can_end,
+            code_execution_config={"executor": executor},
+        )
+        # Set by _handle_request while a chat runs; called on the worker thread
+        # with every message either assistant sends.
+        self.on_assistant_message: Callable[[str], None] | None = None
+        self.ran_code = False      # set by _run_chat: did the last turn execute any code block?
+        # (prompt, reply) turns answered without the agent – streamed or from a response
+        # cache; sent as history with the next stream, handed to the agent on its next turn
+        self.stream_turns: List[tuple[str, str]] = []
+        if ENABLE_PROGRESS_MESSAGES:
+            for agent in (self.assistant, self.assistant_fast):
+                if agent is not None:
+                    agent.register_hook("process_message_before_send", self._forward)
+
+    def has_agent_history(self) -> bool:
+        """True once either assistant has exchanged a message with the user proxy."""
+        return any(
+            self.user_proxy.chat_messages.get(agent)
+            for agent in (self.assistant, self.assistant_fast) if agent is not None
+        )
+
+    def histories(self, agent: autogen.AssistantAgent) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Both records of the conversation with `agent`: the user proxy's and the agent's own."""
+        return self.user_proxy.chat_messages[agent], agent.chat_messages[self.user_proxy]
+
+    def other(self, agent: autogen.AssistantAgent) -> autogen.AssistantAgent | None:
+        return self.assistant_fast if agent is self.assistant else self.assistant
+
+    def has_history(self) -> bool:
+        return bool(self.stream_turns) or self.has_agent_history()
+
+    def add_stream_turn(self, prompt: str, reply: str) -> None:
+        self.stream_turns.append((prompt, reply))
+        del self.stream_turns[:-STREAM_HISTORY_TURNS]
+
+    def take_stream_transcript(self) -> str:
+        """The streamed turns as text for the agent's next message (and forget them)."""
+        turns, self.stream_turns = self.stream_turns, []
+        return "\n".join(f"User: {prompt}\nAssistant: {reply}" for prompt, reply in turns)
+
+    def _forward(self, sender, message, recipient, silent):
+        callback = self.on_assistant_message
+        if callback is not None:
+            content = message.get("content") if isinstance(message, dict) else message
+            if isinstance(content, str) and content:
+                callback(content)
+        return message
+
+# LRU of channel sessions; evicting one drops that channel's conversation history.
+MAX_AGENT_SESSIONS = int(os.getenv("MAX_AGENT_SESSIONS", "32"))
+_agent_sessions: "OrderedDict[int, _AgentSession]" = OrderedDict()
+
+def _agent_session(channel_id: int) -> _AgentSession:
+    session = _agent_sessions.get(channel_id)
+    if session is None:
+        session = _agent_sessions[channel_id] = _AgentSession()
+        while len(_agent_sessions) > MAX_AGENT_SESSIONS:
+            _agent_sessions.popitem(last=False)
+    _agent_sessions.move_to_end(channel_id)
+    return session
+
+# One bounded pool for the blocking AutoGen conversations – the default executor
+# would grow to cpu_count()+4 threads and compete with the Discord heartbeat.
+AUTOGEN_MAX_CONCURRENCY = int(os.getenv("AUTOGEN_MAX_CONCURRENCY", "4"))
+AUTOGEN_EXECUTOR = ThreadPoolExecutor(max_workers=AUTOGEN_MAX_CONCURRENCY, thread_name_prefix="autogen")
+atexit.register(AUTOGEN_EXECUTOR.shutdown, wait=False)
+
+def _ran_code(messages: List[Dict[str, Any]]) -> bool:
+    """True if an assistant turn in `messages` carried a code block – the user proxy executes those."""
+    return any(m.get("name") == BOT_USER and "```" in (m.get("content") or "") for m in messages)
+
+def _needs_escalation(messages: List[Dict[str, Any]], last: str | None) -> bool:
+    """
+    True when the fast run produced no assistant turn at all or asked to escalate.
+    Never after it executed code: the strong model would run it all again.
+    A short reply ("Done.") or a bare TERMINATE is a complete answer.
+    """
+    if _ran_code(messages):
+        return False
+    if last is not None and ESCALATE_WORD in last:
+        return True
+    return not any(m.get("name") == BOT_USER for m in messages)
+
+# With FAST_MODEL set, each assistant keeps its own record of the conversation
+# (clear_history=False appends per recipient). They are kept identical: whatever
+# one run adds is copied into the other's records, so a turn escalated to the
+# strong model sees the earlier fast turns, and later fast turns see its answers.
+def _share_run(session: _AgentSession, agent: autogen.AssistantAgent, marks: List[int]) -> None:
+    """Copy what `agent`'s conversation gained since `marks` into the other assistant's."""
+    other = session.other(agent)
+    if other is None:
+        return
+    for src, dst, mark in zip(session.histories(agent), session.histories(other), marks):
+        dst.extend(dict(m) for m in src[mark:])
+
+def _drop_run(session: _AgentSession, agent: autogen.AssistantAgent, marks: List[int]) -> None:
+    """Forget what `agent`'s conversation gained since `marks`."""
+    for history, mark in zip(session.histories(agent), marks):
+        del history[mark:]
+
+def _initiate(session: _AgentSession, agent: autogen.AssistantAgent, message: str) -> tuple[Any, List[Dict[str, Any]], List[int]]:
+    """
+    initiate_chat with `agent`. Also returns just the messages this run added
+    and where it started in each of the two histories (for _share_run/_drop_run).
+    """
+    # chat_result.chat_history *is* user_proxy.chat_messages[agent], so the
+    # length before the call marks where this run starts
+    marks = [len(history) for history in session.histories(agent)]
+    try:
+        chat_result = session.user_proxy.initiate_chat(
+            agent,
+            message=message,
+            clear_history=False,  # append-only history keeps the cached prefix valid
+        )
+    except BaseException:
+        _share_run(session, agent, marks)   # a failed run may still have executed code
+        raise
+    return chat_result, chat_result.chat_history[marks[0]:], marks
+
+def _run_chat(session: _AgentSession, message: str) -> tuple[Any, str | None]:
+    """
+    Blocking AutoGen conversation turn; runs on AUTOGEN_EXECUTOR.
+    Returns the chat result and its final assistant reply, extracted once here
+    so routing and result processing don't each re-scan the history.
+    """
+    if session.assistant_fast is not None:
+        chat_result, new, marks = _initiate(session, session.assistant_fast, message)
+        session.ran_code = _ran_code(new)
+        last = _last_assistant_content(new)
+        if not _needs_escalation(new, last):
+            if last is not None and ESCALATE_WORD in last:
+                _LOG.warning("Fast model asked to escalate after running code – not repeating the run.")
+                last = None
+            _share_run(session, session.assistant_fast, marks)
+            return chat_result, last
+        _LOG.info(f"Fast model reply inadequate – escalating to {STRONG_MODEL}.")
+        # nothing ran (see _needs_escalation): the strong run replaces this one
+        _drop_run(session, session.assistant_fast, marks)
+    chat_result, new, marks = _initiate(session, session.assistant, message)
+    session.ran_code = _ran_code(new)
+    _share_run(session, session.assistant, marks)
+    return chat_result, _last_assistant_content(new)
 
 # ---------------------------------------------------------------------------
-# 7) Discord glue
+# 7) response caches
+# ---------------------------------------------------------------------------
+CACHE_DIR = Path(__file__).resolve().parent / ".cache"
+CACHE_BACKEND = "gemini" if USE_GEMINI else "openai"
+# Cache namespace: a new model or an edited system prompt must not replay old replies
+CACHE_MODE = "|".join((
+    CACHE_BACKEND, STRONG_MODEL, FAST_MODEL,
+    hashlib.sha256(SYSTEM_MESSAGE.encode("utf-8")).hexdigest()[:16],
+))
+RESPONSE_CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", "0"))   # seconds; 0 disables
+ENABLE_SEMANTIC_CACHE = os.getenv("ENABLE_SEMANTIC_CACHE", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90"))
+SEMANTIC_CACHE_MODEL = os.getenv("SEMANTIC_CACHE_MODEL", SemanticResponseCache.MODEL_NAME)
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", str(SemanticResponseCache.MAX_ENTRIES)))
+
+exact_cache: ExactResponseCache | None = None
+if RESPONSE_CACHE_TTL > 0:
+    exact_cache = ExactResponseCache(CACHE_DIR / "exact", expire=RESPONSE_CACHE_TTL)
+    atexit.register(exact_cache.close)
+    _LOG.info(f"✅ Exact response cache enabled (TTL {RESPONSE_CACHE_TTL}s).")
+
+semantic_cache: SemanticResponseCache | None = None
+if ENABLE_SEMANTIC_CACHE:
+    # one index per cache namespace and embedding model – a reply from another
+    # model/prompt is no hit, and another encoder's vectors can't be compared
+    _semantic_ns = hashlib.sha256(f"{CACHE_MODE}|{SEMANTIC_CACHE_MODEL}".encode("utf-8")).hexdigest()[:16]
+    semantic_cache = SemanticResponseCache(
+        CACHE_DIR / f"semantic_{CACHE_BACKEND}_{_semantic_ns}.pkl",
+        threshold=SEMANTIC_CACHE_THRESHOLD,
+        model_name=SEMANTIC_CACHE_MODEL,
+        expire=RESPONSE_CACHE_TTL or SemanticResponseCache.EXPIRE_SECONDS,   # same TTL as the exact cache
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    )
+    atexit.register(semantic_cache.close)   # adds are written in batches
+    _LOG.info(f"✅ Semantic response cache enabled (threshold {SEMANTIC_CACHE_THRESHOLD}).")
+
+# Both caches block (SQLite behind diskcache, the encoder, the pickle), so the
+# handler calls these through asyncio.to_thread – one hop per lookup or store.
+# A broken cache only ever costs a miss: errors are logged, never raised.
+def _cache_lookup(prompt: str) -> tuple[Any, str | None]:
+    """Exact, then semantic lookup → (prompt embedding for a later store, cached reply)."""
+    if exact_cache is not None:
+        try:
+            hit = exact_cache.get(CACHE_MODE, prompt)
+            if hit is not None:
+                return None, hit
+        except Exception as exc:
+            _LOG.warning(f"Exact cache lookup failed ({exc}) – treating as a miss.")
+    if semantic_cache is not None:
+        try:
+            return semantic_cache.embed_and_lookup(prompt)
+        except Exception as exc:
+            _LOG.warning(f"Semantic cache lookup failed ({exc}) – treating as a miss.")
+    return None, None
+
+def _cache_store(prompt: str, prompt_vec: Any, reply: str) -> None:
+    if exact_cache is not None:
+        try:
+            exact_cache.set(CACHE_MODE, prompt, reply)
+        except Exception as exc:
+            _LOG.warning(f"Exact cache store failed: {exc}")
+    if semantic_cache is not None:
+        try:
+            semantic_cache.add(prompt_vec, reply)
+        except Exception as exc:
+            _LOG.warning(f"Semantic cache store failed: {exc}")
+
+# ---------------------------------------------------------------------------
+# 8) Discord glue
 # ---------------------------------------------------------------------------
 intents = discord.Intents.default()
 intents.message_content = True
 bot = discord.Client(intents=intents)
 
-_channel_locks: Dict[int, asyncio.Lock] = {}
+# Weak values: a channel's lock lives only while a request task holds it, so
+# memory is O(active channels) rather than O(channels ever seen).
+_channel_locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = weakref.WeakValueDictionary()
 _current_tasks: Dict[int, asyncio.Task] = {}
 
-async def _send_long(ch: discord.abc.Messageable, txt: str):
-    for chunk in [txt[i:i+1900] for i in range(0, len(txt), 1900)]:
-        await ch.send(chunk)
+def _channel_lock(channel_id: int) -> asyncio.Lock:
+    lock = _channel_locks.get(channel_id)
+    if lock is None:
+        lock = _channel_locks[channel_id] = asyncio.Lock()
+    return lock
+
+DISCORD_MSG_LIMIT = 2000
+DISCORD_CHUNK = 1900    # chunk size for the no-attachment fallback
+
+async def _send_long(ch: discord.abc.Messageable, txt: str, filename: str = "response.txt"):
+    """Send `txt`; anything over Discord's limit goes out as one attachment (one rate-limited call)."""
+    if len(txt) <= DISCORD_MSG_LIMIT:
+        await ch.send(txt)
+        return
+    try:
+        buf = io.BytesIO(txt.encode("utf-8"))
+        await ch.send(content="📎 Response attached (too long to inline):", file=discord.File(buf, filename=filename))
+        return
+    except discord.Forbidden:
+        _LOG.warning("No permission to attach files here – falling back to chunked messages.")
+    # Sequential on purpose: concurrent sends can land out of order. Link previews
+    # are suppressed, since a chunk cut mid-text rarely needs Discord to unfurl embeds.
+    for chunk in chunk_text(txt, DISCORD_CHUNK):   # lazily, one piece alive at a time
+        await ch.send(chunk, suppress_embeds=True)
 
 RUN_AS_ROOT = os.geteuid() == 0
 # Use plain 'sudo' instead of 'sudo -n' to avoid potential non-interactive failures,
 # assuming passwordless sudo is configured or the script runs as root.
 SUDO: list[str] = [] if RUN_AS_ROOT else ["sudo"]
 
-def _run(cmd: list[str] | str, **kw):
+HOST_CMD_TIMEOUT = 60   # seconds a slash-command script may run
+
+async def _run(cmd: list[str] | str, timeout: float = HOST_CMD_TIMEOUT) -> bytes:
+    """check_output equivalent that awaits the child instead of blocking the event loop."""
     if isinstance(cmd, str):
         cmd = shlex.split(cmd)
-    return subprocess.check_output(SUDO + cmd, **kw)
+    argv = SUDO + cmd
+    proc = await asyncio.create_subprocess_exec(*argv, stdout=asyncio.subprocess.PIPE)
+    try:
+        out, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(argv, timeout)
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, argv, output=out)
+    return out
 
 # ---------------------------------------------------------------------------
-# 8) slash-commands
+# 9) slash-commands
 # ---------------------------------------------------------------------------
-def _handle_host_cmd(cmd: str, args: List[str]) -> tuple[str, str]:
+# argv lists, not strings: nothing to shlex-parse on every slash command
+_STATUS_CMD = ["/usr/local/bin/status_agent.sh"]
+_RESTART_CMD = ["/usr/local/bin/restart_agent.sh"]
+_STOP_CMD = ["/usr/local/bin/stop_agent.sh"]
+_LOGS_CMD = "/usr/local/bin/get_logs.sh"
+
+async def _handle_host_cmd(cmd: str, args: List[str]) -> tuple[str, bytes]:
+    """Run a host slash-command; output stays raw bytes, decoded once by the caller."""
     if cmd == "status":
-        out = _run("/usr/local/bin/status_agent.sh").decode(); return ("Agent status", out or "(no output)")
+        return ("Agent status", await _run(_STATUS_CMD))
     if cmd == "restart":
-        out = _run("/usr/local/bin/restart_agent.sh").decode(); return ("Agent restarted", out or "(no output)")
+        return ("Agent restarted", await _run(_RESTART_CMD))
     if cmd == "stop":
-        out = _run("/usr/local/bin/stop_agent.sh").decode(); return ("Agent stopped", out or "(no output)")
+        return ("Agent stopped", await _run(_STOP_CMD))
     if cmd == "logs":
         n = 50
         if args:
@@ -350,66 +675,246 @@ def _handle_host_cmd(cmd: str, args: List[str]) -> tuple[str, str]:
                     n = 50
             except ValueError:
                 pass
-        out = _run(["/usr/local/bin/get_logs.sh", str(n)]).decode()
-        return (f"Last {n} log lines", out or "(no output)")
-    if cmd == "interrupt": return ("", "")
+        return (f"Last {n} log lines", await _run([_LOGS_CMD, str(n)]))
+    if cmd == "interrupt": return ("", b"")
     raise ValueError(cmd)
 
 # ---------------------------------------------------------------------------
-# 9) Result Processing Helper & Main Request Handler
+# 10) Result Processing Helper & Main Request Handler
 # ---------------------------------------------------------------------------
-async def _process_and_send_result(ch: discord.abc.Messageable, chat_result: Any):
-    """Processes the chat result and sends the final message to Discord."""
+_CODE_BLOCK_RE = re.compile(r"```.*?```", re.DOTALL)
+_CODE_BLOCK_SCAN_MIN = 32 * 1024   # above this, strip fences with a linear scan
+
+def _strip_code_blocks(text: str) -> str:
+    """
+    Remove ```fenced``` blocks – same result as _CODE_BLOCK_RE.sub("", text).
+    Long replies use a linear str.find scan instead, so an unbalanced fence can't
+    make the lazy regex re-scan the whole tail from every later fence.
+    """
+    if len(text) < _CODE_BLOCK_SCAN_MIN:
+        return _CODE_BLOCK_RE.sub("", text)
+    parts, pos = [], 0
+    while (start := text.find("```", pos)) >= 0:
+        end = text.find("```", start + 3)
+        if end < 0:
+            break
+        parts.append(text[pos:start])
+        pos = end + 3
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def _last_assistant_content(messages: List[Dict[str, Any]]) -> str | None:
+    """
+    Last non-empty assistant message, skipping the bare TERMINATE/DONE that ends
+    a chat. Pass only the messages of the current run: with clear_history=False
+    the full history still holds earlier turns, and a run answered with a bare
+    TERMINATE would otherwise re-post the previous turn's answer.
+    """
+    for msg in reversed(messages):
+        if msg.get("name") != BOT_USER:
+            continue
+        content = msg.get("content") or ""
+        if content.strip() and not _TERMINATE_RE.fullmatch(content):
+            return content.strip()
+    return None
+
+ENABLE_STREAMING_CHAT = os.getenv("ENABLE_STREAMING_CHAT", "false").lower() == "true"
+STREAM_EDIT_SEC = 0.5       # refresh the streamed message at most this often…
+STREAM_EDIT_CHARS = 150     # …or whenever this many new characters arrived
+STREAM_HISTORY_TURNS = 10   # agent-less turns kept as history for the next stream
+
+def _tail(parts: List[str], n: int) -> str:
+    """Last `n` characters of "".join(parts), touching only the trailing parts."""
+    picked, size = [], 0
+    for part in reversed(parts):
+        picked.append(part)
+        size += len(part)
+        if size >= n:
+            break
+    return "".join(reversed(picked))[-n:]
+
+async def _stream_reply(ch: discord.abc.Messageable, session: _AgentSession, prompt: str) -> str | None:
+    """
+    Answer a conversational prompt by editing one Discord message as tokens
+    stream in, bypassing AutoGen. The session's earlier streamed turns go along
+    as history. Returns the full reply, or None when the stream failed and the
+    caller should fall back to the agent.
+    """
+    api_key = _next_gemini_key() if USE_GEMINI else OPENAI_API_KEY
+    loop = asyncio.get_running_loop()
+    msg = None
+    parts: List[str] = []
+    total, shown, last_edit = 0, 0, loop.time()
+    try:
+        msg = await ch.send("…")
+        async for delta in stream_completion(
+            prompt, SYSTEM_MESSAGE, model=STRONG_MODEL, api_key=api_key, use_gemini=USE_GEMINI,
+            history=session.stream_turns,
+        ):
+            parts.append(delta)
+            total += len(delta)
+            now = loop.time()
+            if total - shown >= STREAM_EDIT_CHARS or now - last_edit >= STREAM_EDIT_SEC:
+                await msg.edit(content=_tail(parts, 1990))
+                shown, last_edit = total, now
+    except Exception as exc:      # includes a failed send/edit of the preview message
+        _LOG.warning(f"Streaming reply failed ({exc}) – falling back to AutoGen.")
+        if USE_GEMINI and "API key not valid" in str(exc):
+            _grw.GeminiRetryWrapper.mark_key_bad(api_key)
+        await _delete_quietly(msg)
+        return None
+
+    buf = "".join(parts).strip()   # the only full join
+    if not buf:
+        await _delete_quietly(msg)
+        return None
+    try:
+        if len(buf) <= DISCORD_MSG_LIMIT:
+            await msg.edit(content=buf)
+        else:
+            await _send_long(ch, buf)
+            await _delete_quietly(msg)   # the preview only showed the tail
+    except discord.HTTPException as exc:
+        _LOG.warning(f"Could not post the streamed reply ({exc}) – falling back to AutoGen.")
+        await _delete_quietly(msg)
+        return None
+    return buf
+
+async def _delete_quietly(msg: discord.Message | None) -> None:
+    """Delete a preview message; it may already be gone, or Discord may refuse for now."""
+    if msg is None:
+        return
+    try:
+        await msg.delete()
+    except discord.HTTPException as exc:
+        _LOG.warning(f"Could not delete the streaming preview: {exc}")
+
+async def _drain_progress(ch: discord.abc.Messageable, queue: asyncio.Queue) -> str | None:
+    """
+    Post assistant turns from `queue` until the None sentinel. Each one is held
+    back until the next arrives, so the final reply – posted by
+    _process_and_send_result – doesn't go out twice. Returns the held text.
+    """
+    held = None
+    while (content := await queue.get()) is not None:
+        text = _strip_code_blocks(content).strip()
+        if not text or _TERMINATE_RE.fullmatch(text) or ESCALATE_WORD in text:
+            continue
+        if held is not None:
+            await _send_long(ch, held)
+        held = text
+    return held
+
+async def _run_chat_with_progress(ch: discord.abc.Messageable, session: _AgentSession, content: str) -> tuple[Any, str | None]:
+    """_run_chat on AUTOGEN_EXECUTOR, relaying intermediate turns when ENABLE_PROGRESS_MESSAGES is on."""
+    loop = asyncio.get_running_loop()
+    if not ENABLE_PROGRESS_MESSAGES:
+        return await loop.run_in_executor(AUTOGEN_EXECUTOR, _run_chat, session, content)
+    progress: asyncio.Queue = asyncio.Queue()
+    session.on_assistant_message = lambda c: loop.call_soon_threadsafe(progress.put_nowait, c)
+    drain = asyncio.create_task(_drain_progress(ch, progress))
+    try:
+        chat_result, last = await loop.run_in_executor(AUTOGEN_EXECUTOR, _run_chat, session, content)
+    except BaseException:
+        drain.cancel()
+        raise
+    finally:
+        session.on_assistant_message = None
+    # queued after every message the worker scheduled, so the drain sees them all first
+    progress.put_nowait(None)
+    held = await drain
+    if held and held != _strip_code_blocks(last or "").strip():
+        await _send_long(ch, held)
+    return chat_result, last
+
+async def _process_and_send_result(ch: discord.abc.Messageable, chat_result: Any, last: str | None) -> str | None:
+    """Processes the chat result and sends the final message to Discord.
+
+    Returns the text that was sent (None if nothing worth caching was sent).
+    """
     if not chat_result:
          _LOG.error("Internal state error: _process_and_send_result called with no chat result.")
          await ch.send("⚠️ Internal state error: Processing failed due to missing chat result.")
-         return
+         return None
 
     # Process execution results automatically included by executor
-    # Send only last assistant content without codeblocks
-    last = None
-    for msg in reversed(chat_result.chat_history):
-        if msg.get("name") == BOT_USER and msg.get("content","").strip():
-            last = msg["content"].strip(); break
+    # Send only last assistant content (from _run_chat) without codeblocks
     if not last:
          _LOG.warning("No reply content generated by assistant in the final result.")
          await ch.send("⚠️ No reply generated by the agent.")
-         return
+         return None
 
-    cleaned = re.sub(r"```.*?```", "", last, flags=re.DOTALL).strip()
+    cleaned = _strip_code_blocks(last).strip()
     # Use _send_long to handle potential long messages and avoid Discord 2000 char limit
     if cleaned: # Only send if there's content after cleaning
          await _send_long(ch, cleaned)
+         return cleaned
     else:
          # If cleaning removed everything (e.g., response was only code blocks), send a notification.
          _LOG.info("Agent response contained only code blocks (executed, not displayed).")
          await ch.send("ℹ️ Agent response contained only code blocks (executed, not displayed). Task likely completed.")
+         return None
+
 
+# Error classifiers for the recovery loop. AutoGen wraps Gemini failures as
+# "Google GenAI exception occurred while calling Gemini API: <cause>", so one
+# scan finds the prefix and tells the two recoverable causes apart.
+_GENAI_ERROR_RE = re.compile(r"Google GenAI exception occurred.*?(list index out of range|API key not valid)", re.DOTALL)
+# The "400 … exceeds the maximum … allowed (N)" form always contains this phrase too.
+_TOKEN_LIMIT_RE = re.compile(r"input token count \(\d+\) exceeds", re.IGNORECASE)
 
-async def _handle_request(ch: discord.abc.Messageable, original_content: str):
-    lock = _channel_locks.setdefault(ch.id, asyncio.Lock())
+async def _handle_request(ch: discord.abc.Messageable, original_content: str, lock: asyncio.Lock):
     async with lock:
-        loop = asyncio.get_running_loop()
+        session = _agent_session(ch.id)
         current_content = original_content
 
+        # Response caches: a repeat (or close-enough) prompt skips the AutoGen round-trip.
+        # The key is the prompt alone, so only the first turn of a fresh session may
+        # use them – "yes" or "deploy it" mean something else in every conversation.
+        use_cache = (exact_cache is not None or semantic_cache is not None) and not session.has_history()
+        prompt_vec = None
+        if use_cache:
+            prompt_vec, cached_reply = await asyncio.to_thread(_cache_lookup, original_content)
+            if cached_reply is not None:
+                _LOG.info(f"Answered from cache: {original_content[:70]}...")
+                await _send_long(ch, cached_reply)
+                # the reply is now part of this channel's conversation: later turns
+                # are no longer cache-eligible, and the agent gets it as context
+                session.add_stream_turn(original_content, cached_reply)
+                return # CACHE HIT: Exit function
+
+        # Plain conversation: stream straight from the model instead of the agent loop –
+        # only before the agent has history, which the stream couldn't see ("yes" to what?)
+        if ENABLE_STREAMING_CHAT and not session.has_agent_history() and looks_conversational(original_content):
+            reply = await _stream_reply(ch, session, original_content)
+            if reply:
+                session.add_stream_turn(original_content, reply)
+                if use_cache:
+                    await asyncio.to_thread(_cache_store, original_content, prompt_vec, reply)
+                return # STREAMED: Exit function
+
+        # The agent never saw the streamed / cached exchange – give it the transcript once
+        if session.stream_turns:
+            current_content = (
+                f"Earlier in this conversation:\n{session.take_stream_transcript()}\n\n"
+                f"New message: {original_content}"
+            )
+
         for attempt in range(1, MAX_RECOVERY_ATTEMPTS + 1):
             _LOG.info(f"Attempt {attempt}/{MAX_RECOVERY_ATTEMPTS} for original request: {original_content[:70]}...")
             if attempt > 1:
                 _LOG.info(f"Retry attempt {attempt} using content: {current_content[:150]}...")
 
             try:
-                await ch.typing()
-                _LOG.info(f"Calling user_proxy.initiate_chat (attempt {attempt})...")
-                chat_result = await loop.run_in_executor(
-                    None,
-                    lambda: user_proxy.initiate_chat(
-                        assistant,
-                        message=current_content,
-                        clear_history=False,
-                    )
-                )
+                _LOG.info(f"Calling initiate_chat for channel {ch.id} (attempt {attempt})...")
+                # keeps the indicator alive for the whole chat (a bare await shows it once, ~10 s)
+                async with ch.typing():
+                    chat_result, last = await _run_chat_with_progress(ch, session, current_content)
                 _LOG.info(f"Initiate_chat completed successfully on attempt {attempt}.")
-                await _process_and_send_result(ch, chat_result)
+                reply = await _process_and_send_result(ch, chat_result, last)
+                # a run that executed code did something – replaying its reply wouldn't
+                if reply and use_cache and not session.ran_code:
+                    await asyncio.to_thread(_cache_store, original_content, prompt_vec, reply)
                 return # SUCCESS: Exit function
 
             except asyncio.CancelledError:
@@ -427,9 +932,11 @@ async def _handle_request(ch: discord.abc.Messageable, original_content: str):
                     return # FAILED PERMANENTLY: Exit function
 
                 recovered_for_next_attempt = False
+                genai_error = _GENAI_ERROR_RE.search(error_message)
+                genai_cause = genai_error.group(1) if genai_error else None
 
                 # A) Gemini “list index out of range”
-                if "Google GenAI exception occurred" in error_message and "list index out of range" in error_message:
+                if genai_cause == "list index out of range":
                     _LOG.error(f"Attempt {attempt} (list index out of range). Preparing for retry {attempt + 1}.")
                     #await ch.send(f"⚠️ AI model error (attempt {attempt}/{MAX_RECOVERY_ATTEMPTS}). Retrying...")
                     current_content = (
@@ -441,43 +948,19 @@ async def _handle_request(ch: discord.abc.Messageable, original_content: str):
                     recovered_for_next_attempt = True
                 
                 # B) "API key not valid"
-                elif "Google GenAI exception occurred" in error_message and "API key not valid" in error_message:
+                elif genai_cause == "API key not valid":
                     _LOG.error(f"Attempt {attempt} (API key not valid). Preparing for retry {attempt + 1}.")
                     
+                    # GeminiRetryWrapper already benched the rejected key and tried the
+                    # others – reaching here means none of the configured keys is usable.
                     if USE_GEMINI and GEMINI_API_KEYS:
-                        if len(GEMINI_API_KEYS) <= 1:
-                            _LOG.warning(f"Attempt {attempt}: Only one or zero Gemini API keys configured. Cannot switch to a different key.")
-                            await ch.send(f"⚠️ AI API key error (attempt {attempt}/{MAX_RECOVERY_ATTEMPTS}). Only one key available, cannot switch. This error may persist.")
-                            # Not setting recovered_for_next_attempt = True, so it will fall to unhandled.
-                        else: # More than one key available
-                            #await ch.send(f"⚠️ AI API key error (attempt {attempt}/{MAX_RECOVERY_ATTEMPTS}). Retrying with new key...")
-                            current_api_key_in_config = assistant.llm_config.get("config_list", [{}])[0].get("api_key")
-                            other_keys = [k for k in GEMINI_API_KEYS if k != current_api_key_in_config]
-                            
-                            if not other_keys: 
-                                _LOG.error(f"Logic error in API key selection for attempt {attempt + 1}. No other keys found despite multiple total keys ({len(GEMINI_API_KEYS)} total, current: ...{current_api_key_in_config[-4:]}).")
-                                await ch.send("⚠️ Internal error during API key switch. Cannot retry this way.")
-                            else:
-                                new_api_key = random.choice(other_keys)
-                                if assistant.llm_config.get("config_list") and isinstance(assistant.llm_config["config_list"], list) and assistant.llm_config["config_list"]:
-                                    assistant.llm_config["config_list"][0]["api_key"] = new_api_key
-                                    _LOG.info(f"Switched to new Gemini API key for attempt {attempt + 1}: ...{new_api_key[-4:] if len(new_api_key) >= 4 else '****'}")
-                                    current_content = (
-                                        "The previous attempt failed due to an API key validation error. "
-                                        "A new API key has been selected. Please process the original request again.\n"
-                                        f"Original request was: {original_content}"
-                                    )
-                                    recovered_for_next_attempt = True
-                                else:
-                                    _LOG.error("Cannot update API key for attempt {attempt + 1}: llm_config['config_list'] is missing or invalid.")
-                                    await ch.send("⚠️ Internal configuration error: Could not switch API key for retry.")
+                        await ch.send(f"⚠️ AI API key error (attempt {attempt}/{MAX_RECOVERY_ATTEMPTS}). No valid Gemini API key is left to switch to.")
                     else: 
                         _LOG.warning(f"Attempt {attempt}: Cannot retry with new Gemini key: Not using Gemini or no API keys available.")
                         await ch.send("⚠️ Cannot attempt API key recovery: Gemini not in use or no API keys configured.")
 
                 # C) Gemini global-context hard limit
-                elif (re.search(r"400.*input token count \(\d+\) exceeds the maximum.*allowed \(\d+\)", error_message, re.IGNORECASE | re.DOTALL) or
-                      re.search(r"input token count \(\d+\) exceeds", error_message, re.IGNORECASE)):
+                elif _TOKEN_LIMIT_RE.search(error_message):
                     _LOG.info(f"Attempt {attempt} (Token limit error). Preparing for retry {attempt + 1} with pruning.")
                     
                     if USE_GEMINI:
@@ -521,8 +1004,52 @@ async def _handle_request(ch: discord.abc.Messageable, original_content: str):
         await ch.send("⚠️ An unexpected issue occurred with the retry logic. Please report this.")
 
 # ---------------------------------------------------------------------------
-# 10) Discord event handlers
+# 11) Discord event handlers
 # ---------------------------------------------------------------------------
+# Messages answered locally – no lock, no LLM call. Deliberately narrow: short
+# replies like "yes"/"ok" are often answers to a question the agent asked.
+_TRIVIAL_RE = re.compile(r"(?:(hi|hello|hey)|(ping)|(thanks|thank you|thx|ty))[!. ]*", re.IGNORECASE)
+_TRIVIAL_REPLIES = ("👋 Hi! What should I work on?", "🏓 pong", "👍 You're welcome!")
+
+def _trivial_reply(content: str) -> str | None:
+    m = _TRIVIAL_RE.fullmatch(content.strip())
+    return _TRIVIAL_REPLIES[m.lastindex - 1] if m else None
+
+# Discord splits a long paste into several ≤2000-char messages. Buffer a burst per
+# channel and hand the agent one prompt instead of answering the first fragment.
+INBOUND_BATCH_DELAY_SEC = float(os.getenv("DISCORD_TEXT_BATCH_DELAY_SECONDS", "0.6"))   # 0 disables
+INBOUND_SPLIT_DELAY_SEC = float(os.getenv("DISCORD_TEXT_BATCH_SPLIT_DELAY_SECONDS", "2.0"))
+_pending_messages: Dict[int, List[str]] = {}
+_flush_tasks: Dict[int, asyncio.Task] = {}
+
+def _start_request(ch: discord.abc.Messageable, content: str) -> None:
+    lock = _channel_lock(ch.id)
+    # the task keeps the strong reference to `lock` for as long as it runs
+    task = asyncio.create_task(_handle_request(ch, content, lock))
+    _current_tasks[ch.id] = task
+    task.add_done_callback(lambda t: _current_tasks.pop(ch.id, None))
+
+async def _flush_pending(ch: discord.abc.Messageable, delay: float) -> None:
+    await asyncio.sleep(delay)       # cancelled and rescheduled while fragments keep arriving
+    _flush_tasks.pop(ch.id, None)
+    content = "\n".join(_pending_messages.pop(ch.id, ()))
+    if _channel_lock(ch.id).locked():
+        await ch.send("⏳ Busy – type /interrupt.")
+        return
+    _start_request(ch, content)
+
+def _queue_message(ch: discord.abc.Messageable, content: str) -> None:
+    if INBOUND_BATCH_DELAY_SEC <= 0:
+        _start_request(ch, content)
+        return
+    _pending_messages.setdefault(ch.id, []).append(content)
+    pending_flush = _flush_tasks.get(ch.id)
+    if pending_flush is not None:
+        pending_flush.cancel()
+    # a (nearly) full message is probably one piece of a split paste – wait longer for the rest
+    delay = INBOUND_SPLIT_DELAY_SEC if len(content) >= 1900 else INBOUND_BATCH_DELAY_SEC
+    _flush_tasks[ch.id] = asyncio.create_task(_flush_pending(ch, delay))
+
 @bot.event
 async def on_ready():
     print(f"✅ Logged in as {bot.user} (discord {discord.__version__}) – HOME={HOME_DIR}")
@@ -534,27 +1061,36 @@ async def on_message(msg: discord.Message):
     if msg.content.startswith("/"):
         parts = msg.content[1:].split(); cmd, args = parts[0].lower(), parts[1:]
         if cmd == "interrupt":
+            pending_flush = _flush_tasks.pop(msg.channel.id, None)
+            if pending_flush is not None:   # drop a batch that hasn't been dispatched yet
+                pending_flush.cancel()
+                _pending_messages.pop(msg.channel.id, None)
             t = _current_tasks.get(msg.channel.id)
             if t and not t.done(): t.cancel(); await msg.channel.send("🚫 Current task cancelled.")
+            elif pending_flush is not None: await msg.channel.send("🚫 Pending message dropped.")
             else: await msg.channel.send("⚠️ No running task.")
             return
         try:
-            title, out = _handle_host_cmd(cmd, args)
-            await _send_long(msg.channel, f"**{title}**\n```{out}```")
+            title, out = await _handle_host_cmd(cmd, args)
+            # one tolerant decode – a stray non-UTF-8 byte in a log must not fail the command
+            text = out.decode("utf-8", errors="replace") or "(no output)"
+            await _send_long(msg.channel, f"**{title}**\n```{text}```")
         except Exception as e:
             await msg.channel.send(f"⚠️ {e}")
         return
+    # trivial chatter: canned reply, zero tokens
+    canned = _trivial_reply(msg.content)
+    if canned is not None:
+        await msg.channel.send(canned)
+        return
     # normal interaction
-    lock = _channel_locks.setdefault(msg.channel.id, asyncio.Lock())
-    if lock.locked():
+    if _channel_lock(msg.channel.id).locked():
         await msg.channel.send("⏳ Busy – type /interrupt.")
         return
-    task = asyncio.create_task(_handle_request(msg.channel, msg.content))
-    _current_tasks[msg.channel.id] = task
-    task.add_done_callback(lambda t: _current_tasks.pop(msg.channel.id, None))
+    _queue_message(msg.channel, msg.content)
 
 # ---------------------------------------------------------------------------
-# 11) run the bot
+# 12) run the bot
 # ---------------------------------------------------------------------------
 if __name__ == "__main__":
     bot.run(DISCORD_BOT_TOKEN)
@@ -0,0 +1,87 @@
+# filename: chat_utils.py
+"""
+Chat utilities
+──────────────
+Pure helpers the Discord bot uses on messages, kept free of discord / autogen
+imports so they can be tested on their own.
+
+• chunk_text     – split a long reply into Discord‑sized pieces without
+  breaking ``` code fences
+• HistoryWindow  – `process_all_messages_before_reply` hook that windows the
+  history sent to the LLM
+"""
+
+from __future__ import annotations
+import logging, re
+from typing import Any, Dict, Iterator, List
+
+# ── basic logging ────────────────────────────────────────────────────────────
+_LOG = logging.getLogger("ChatUtils")
+
+
+# ── reply chunking ───────────────────────────────────────────────────────────
+FENCE_LINE_RE = re.compile(r"```[\w+#.-]{0,20}")   # a fence line that is only ``` + language tag
+
+def chunk_text(text: str, limit: int) -> Iterator[str]:
+    """
+    Yield pieces of `text` of at most `limit` characters, cut at the last
+    paragraph break, else line break, else space in the second half of the
+    window – hard cut only if there is none. A ``` fence left open by a cut
+    is closed at the end of the piece and reopened (with its language tag) at
+    the start of the next, so every message renders on its own.
+    """
+    fence = ""            # opening line to repeat while inside a code block
+    pos, n = 0, len(text)
+    while pos < n:
+        prefix = fence + "\n" if fence else ""
+        if n - pos <= limit - len(prefix):
+            yield prefix + text[pos:]
+            return
+        end = pos + limit - len(prefix) - 4          # room for a closing "\n```"
+        half = (pos + end) // 2                      # a break in the first half would waste the message
+        for sep in ("\n\n", "\n", " "):
+            cut = text.rfind(sep, half, end)
+            if cut >= 0:
+                piece, pos = text[pos:cut], cut + len(sep)
+                break
+        else:
+            piece, pos = text[pos:end], end
+        i = 0
+        while (i := piece.find("```", i)) >= 0:     # track fence state across the piece
+            if fence:
+                fence = ""
+            else:
+                eol = piece.find("\n", i)
+                line = piece[i:eol if eol >= 0 else len(piece)]
+                fence = line if FENCE_LINE_RE.fullmatch(line) else "```"
+            i += 3
+        yield prefix + piece + ("\n```" if fence else "")
+
+
+# ── history window ───────────────────────────────────────────────────────────
+class HistoryWindow:
+    """
+    Expanding window over the assistant's chat history with deferred truncation.
+
+    The window grows append-only (so every request shares the previous prefix
+    and provider prompt caches keep hitting) until it holds `max_len` messages,
+    then jumps forward to the first user turn among the last `keep` messages
+    and starts growing again.
+    Only what is sent to the LLM is windowed – the stored history is untouched.
+    """
+    def __init__(self, max_len: int, keep: int):
+        self.max_len, self.keep = max_len, keep
+        self.start = 0
+
+    def __call__(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.start > len(messages):        # history was cleared underneath us
+            self.start = 0
+        if len(messages) - self.start >= self.max_len:
+            start = len(messages) - self.keep
+            # the window must open on a user turn – starting on an assistant
+            # reply (or a tool result) leaves the provider an orphaned turn
+            while start < len(messages) - 1 and messages[start].get("role") != "user":
+                start += 1
+            self.start = start
+            _LOG.info(f"History window full – now sending messages {self.start}..{len(messages)}.")
+        return messages[self.start:]
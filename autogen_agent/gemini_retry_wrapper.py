@@ -8,6 +8,7 @@ Adds
 • exponential‑and‑jitter back‑off for 429 / 5xx
 • honours Google’s `retry_delay`
 • automatic API‑key rotation (round‑robin) from $GEMINI_API_KEYS
+• rejected keys ("API key not valid") sit out a cooldown
 • global wall‑clock cut‑off (default 8 h)
 
 On import we *surgically replace* every already‑cached reference
@@ -16,7 +17,7 @@ wrapper is guaranteed to be used.
 """
 
 from __future__ import annotations
-import os, sys, time, random, re, logging, itertools
+import os, sys, time, random, re, logging, itertools, threading
 from importlib import import_module
 from typing import Any, Dict, List
 import tiktoken # Added for token counting
@@ -101,10 +102,13 @@ class GeminiRetryWrapper(BaseGemini):                    # noqa: N801
     BASE_BACKOFF      = 1.0                # seconds
     MAX_BACKOFF       = 300                # 5 min cap
     KEY_ROTATE_EVERY  = 3                  # failures per key before rotating
+    KEY_COOLDOWN_SEC  = 15 * 60            # a rejected key sits out this long
 
     # key‑pool shared by *all* instances
     _KEYS: List[str] = []
     _key_cycle = None
+    _key_lock = threading.Lock()           # clients are created and run on worker threads
+    _bad_until: Dict[str, float] = {}      # key → monotonic time it may be used again
 
     # ── life‑cycle ───────────────────────────────────────────────────────────
     def __init__(self, *args: Any, **kw: Any):
@@ -127,13 +131,31 @@ class GeminiRetryWrapper(BaseGemini):                    # noqa: N801
         if not GeminiRetryWrapper._KEYS:      # pragma: no cover
             raise RuntimeError("GeminiRetryWrapper: no API keys provided")
 
-        if GeminiRetryWrapper._key_cycle is None:
-            GeminiRetryWrapper._key_cycle = itertools.cycle(GeminiRetryWrapper._KEYS)
-
-        self._switch_key(next(GeminiRetryWrapper._key_cycle))
+        # every key cooling down – use one anyway rather than fail outright
+        self._switch_key(self.next_key() or GeminiRetryWrapper._KEYS[0])
         self._tokenizer = tokenizer # Store tokenizer instance if needed later
 
     # ── helpers ──────────────────────────────────────────────────────────────
+    @staticmethod
+    def next_key(avoid: str | None = None) -> str | None:
+        """Next key in rotation that is neither `avoid` nor cooling down; None if none is left."""
+        with GeminiRetryWrapper._key_lock:
+            if GeminiRetryWrapper._key_cycle is None:
+                GeminiRetryWrapper._key_cycle = itertools.cycle(GeminiRetryWrapper._KEYS)
+            now = time.monotonic()
+            for _ in range(len(GeminiRetryWrapper._KEYS)):
+                key = next(GeminiRetryWrapper._key_cycle)
+                if key != avoid and GeminiRetryWrapper._bad_until.get(key, 0.0) <= now:
+                    return key
+            return None
+
+    @staticmethod
+    def mark_key_bad(key: str) -> None:
+        """Bench a rejected key for KEY_COOLDOWN_SEC."""
+        with GeminiRetryWrapper._key_lock:
+            GeminiRetryWrapper._bad_until[key] = time.monotonic() + GeminiRetryWrapper.KEY_COOLDOWN_SEC
+        _LOG.warning("🔑  Gemini key ****%s rejected – cooling down", key[-4:])
+
     def _switch_key(self, key: str) -> None:
         """Hot‑swap the API key inside both wrapper *and* underlying client."""
         self.api_key = key
@@ -203,6 +225,17 @@ class GeminiRetryWrapper(BaseGemini):                    # noqa: N801
 
             except Exception as exc:  # Catch other exceptions for retries
                 msg = str(exc)
+                if "API key not valid" in msg:
+                    # bench the key this client actually used and move on to a
+                    # healthy one; only when none is left does the error escape
+                    self.mark_key_bad(self.api_key)
+                    key = self.next_key(avoid=self.api_key)
+                    if key is None:
+                        raise exc
+                    self._switch_key(key)
+                    failures_on_key = 0
+                    continue
+
                 # Check only for standard retriable HTTP codes now
                 is_http_retriable = (
                     "429" in msg or "quota" in msg or
@@ -233,7 +266,9 @@ class GeminiRetryWrapper(BaseGemini):                    # noqa: N801
                     failures_on_key >= self.KEY_ROTATE_EVERY
                     and len(self._KEYS) > 1
                 ):
-                    self._switch_key(next(GeminiRetryWrapper._key_cycle))
+                    key = self.next_key(avoid=self.api_key)
+                    if key is not None:
+                        self._switch_key(key)
                     failures_on_key = 0
 
     # --- helper ---------------------------------------------------------------
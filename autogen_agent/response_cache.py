@@ -0,0 +1,250 @@
+# filename: response_cache.py
+"""
+Response caches
+───────────────
+Let the Discord bot answer a repeat prompt without another AutoGen round‑trip.
+
+• ExactResponseCache    – `diskcache` store keyed by sha256(mode|prompt); a
+  byte‑identical repeat is one local lookup.  LRU‑evicted, entries expire
+  after a TTL, and every write is on disk so redeploys keep their hits.
+• SemanticResponseCache – embeds the prompt with a small sentence‑transformer
+  (MiniLM) and reuses the stored reply of the nearest previous prompt when
+  their cosine similarity reaches the threshold.  Same TTL as the exact
+  cache, capped at `max_entries`, written to disk in batches.
+
+Embeddings are L2‑normalised, so a plain inner product *is* the cosine
+similarity (same maths as a FAISS ``IndexFlatIP``, without the dependency).
+Both `sentence-transformers` and `numpy` are optional – if either is
+missing the cache logs a warning once and behaves as an always‑miss.
+Third‑party modules are imported by the cache that needs them, so a bot
+running with caching disabled never loads `diskcache` or `numpy`.
+"""
+
+from __future__ import annotations
+import hashlib, logging, os, pickle, threading, time
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+# ── basic logging ────────────────────────────────────────────────────────────
+_LOG = logging.getLogger("ResponseCache")
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)                  # atomic – never leave a torn file
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+class ExactResponseCache:
+    """(mode, prompt) → reply, persisted with diskcache (atomic get/set, LRU eviction)."""
+
+    EXPIRE_SECONDS = 7 * 24 * 60 * 60       # a week
+    SIZE_LIMIT     = 2_000_000_000           # bytes on disk
+
+    def __init__(self, directory: Path, expire: int = EXPIRE_SECONDS, size_limit: int = SIZE_LIMIT):
+        from diskcache import Cache
+        self.expire = expire
+        self._cache = Cache(
+            str(directory), size_limit=size_limit, eviction_policy="least-recently-used",
+        )
+        _LOG.info("✅ Exact cache at %s holds %d entries", directory, len(self._cache))
+
+    @staticmethod
+    def _key(mode: str, prompt: str) -> str:
+        return hashlib.sha256(f"{mode}|{prompt}".encode("utf-8")).hexdigest()
+
+    # ── public API ───────────────────────────────────────────────────────────
+    def get(self, mode: str, prompt: str) -> Optional[str]:
+        hit = self._cache.get(self._key(mode, prompt))
+        if hit is None:
+            return None
+        _LOG.info("🎯 exact cache hit")
+        return hit["response"]
+
+    def set(self, mode: str, prompt: str, reply: str) -> None:
+        self._cache.set(self._key(mode, prompt), {"response": reply}, expire=self.expire)
+
+    def close(self) -> None:
+        self._cache.close()
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+class SemanticResponseCache:
+    """Nearest‑neighbour prompt → reply cache persisted as a pickle.
+
+    Entries are kept in insertion order, so both the TTL and the size cap
+    evict a prefix.  Vectors live in a pre‑grown buffer (no vstack copy per
+    add) and the pickle is rewritten in batches, not on every add.
+    """
+
+    MODEL_NAME      = "all-MiniLM-L6-v2"  # 384‑d, ~80 MB, CPU friendly
+    EXPIRE_SECONDS  = ExactResponseCache.EXPIRE_SECONDS
+    MAX_ENTRIES     = 10_000
+    SAVE_EVERY      = 32                  # adds between pickle rewrites…
+    SAVE_INTERVAL   = 5 * 60              # …or seconds, whichever comes first
+
+    def __init__(self, path: Path, threshold: float = 0.90, model_name: str = MODEL_NAME,
+                 expire: int = EXPIRE_SECONDS, max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.threshold = threshold
+        self.model_name = model_name
+        self.expire = expire
+        self.max_entries = max(1, max_entries)
+        try:
+            import numpy as np
+        except ImportError:  # pragma: no cover
+            np = None
+        self._np = np
+        self._lock = threading.Lock()      # embed/lookup/add run on worker threads
+        self._encoder: Any = None
+        self._disabled = np is None
+        self._vectors: Any = None          # (capacity, d) float32, rows [0, _n) in use, L2‑normalised
+        self._n = 0
+        self._replies: List[str] = []
+        self._stamps: List[float] = []     # wall‑clock time each entry was added
+        self._unsaved = 0
+        self._saved_at = time.monotonic()
+        if self._disabled:
+            _LOG.warning("⚠️ numpy not installed – semantic response cache disabled.")
+        else:
+            self._load()
+
+    # ── persistence ──────────────────────────────────────────────────────────
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            with self.path.open("rb") as fh:
+                data = pickle.load(fh)
+            vectors, replies = data["vectors"], list(data["replies"])
+            stamps = list(data.get("stamps") or [time.time()] * len(replies))
+            if vectors is not None and len(replies):
+                self._vectors = self._np.array(vectors, dtype="float32")
+                self._n, self._replies, self._stamps = len(replies), replies, stamps
+                self._evict(time.time())
+            _LOG.info("✅ Loaded %d semantic cache entries from %s", self._n, self.path)
+        except Exception as exc:
+            _LOG.warning("⚠️ Could not load semantic cache %s (%s) – starting empty.", self.path, exc)
+            self._reset()
+
+    def _save(self) -> None:
+        vectors = None if self._vectors is None else self._vectors[:self._n]
+        _atomic_write(self.path, pickle.dumps(
+            {"vectors": vectors, "replies": self._replies, "stamps": self._stamps}
+        ))
+        self._unsaved, self._saved_at = 0, time.monotonic()
+
+    def flush(self) -> None:
+        """Write pending adds to disk (called at exit; adds otherwise save in batches)."""
+        with self._lock:
+            if self._unsaved:
+                try:
+                    self._save()
+                except Exception as exc:
+                    _LOG.warning("⚠️ Could not persist semantic cache to %s: %s", self.path, exc)
+
+    close = flush
+
+    # ── storage (callers hold _lock) ─────────────────────────────────────────
+    def _reset(self) -> None:
+        self._vectors, self._n, self._replies, self._stamps = None, 0, [], []
+
+    def _drop_oldest(self, k: int) -> None:
+        if k <= 0:
+            return
+        n = self._n
+        self._vectors[:n - k] = self._vectors[k:n]     # numpy copes with the overlap
+        self._n = n - k
+        del self._replies[:k], self._stamps[:k]
+        self._unsaved += 1
+
+    def _evict(self, now: float) -> None:
+        """Drop expired entries, then the oldest ones beyond max_entries."""
+        expired = 0
+        while expired < self._n and now - self._stamps[expired] > self.expire:
+            expired += 1
+        self._drop_oldest(expired)
+        self._drop_oldest(self._n - self.max_entries)
+
+    def _matches_dim(self, vec: Any) -> bool:
+        """False – and the stored entries are dropped – when *vec* comes from a different model."""
+        if self._vectors is None or self._vectors.shape[1] == vec.shape[1]:
+            return True
+        _LOG.warning("⚠️ Semantic cache holds %d‑d vectors but the encoder gives %d‑d – discarding %d entries.",
+                     self._vectors.shape[1], vec.shape[1], self._n)
+        self._reset()
+        self._unsaved += 1
+        return False
+
+    # ── encoder ──────────────────────────────────────────────────────────────
+    def _get_encoder(self) -> Any:
+        with self._lock:                   # load the model once, even under concurrent first calls
+            if self._encoder is None and not self._disabled:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    self._encoder = SentenceTransformer(self.model_name)
+                    _LOG.info("✅ Semantic cache encoder '%s' loaded.", self.model_name)
+                except Exception as exc:
+                    _LOG.warning("⚠️ sentence-transformers unavailable (%s) – semantic response cache disabled.", exc)
+                    self._disabled = True
+            return self._encoder
+
+    # ── public API ───────────────────────────────────────────────────────────
+    def embed(self, text: str) -> Any:
+        """Return the normalised embedding of *text* (None if disabled).
+
+        Blocking (model load on first call, then a few ms of CPU) – run it
+        in an executor from async code.
+        """
+        encoder = self._get_encoder()
+        if encoder is None:
+            return None
+        return encoder.encode([text], normalize_embeddings=True).astype("float32")
+
+    def lookup(self, vec: Any) -> Optional[str]:
+        """Return the cached reply for the nearest live prompt above threshold."""
+        if vec is None:
+            return None
+        with self._lock:                   # one (N, d) @ (d,) product – cheap enough to hold the lock
+            self._evict(time.time())
+            if not self._n or not self._matches_dim(vec):
+                return None
+            sims = self._vectors[:self._n] @ vec[0]
+            best = int(sims.argmax())
+            if sims[best] < self.threshold:
+                return None
+            _LOG.info("🎯 semantic cache hit (similarity %.3f)", sims[best])
+            return self._replies[best]
+
+    def embed_and_lookup(self, text: str) -> Tuple[Any, Optional[str]]:
+        """embed() + lookup() in one call, so async callers need a single thread hop."""
+        vec = self.embed(text)
+        return vec, self.lookup(vec)
+
+    def add(self, vec: Any, reply: str) -> None:
+        """Store *reply* under the embedding *vec*; persisted every SAVE_EVERY adds / SAVE_INTERVAL s."""
+        if vec is None:
+            return
+        with self._lock:
+            now = time.time()
+            self._evict(now)
+            self._matches_dim(vec)
+            self._drop_oldest(self._n + 1 - self.max_entries)
+            if self._vectors is None:
+                self._vectors = self._np.empty((64, vec.shape[1]), dtype="float32")
+            elif self._n == len(self._vectors):           # grow geometrically, amortised O(1) per add
+                grown = self._np.empty((2 * self._n, vec.shape[1]), dtype="float32")
+                grown[:self._n] = self._vectors
+                self._vectors = grown
+            self._vectors[self._n] = vec[0]
+            self._n += 1
+            self._replies.append(reply)
+            self._stamps.append(now)
+            self._unsaved += 1
+            if self._unsaved >= self.SAVE_EVERY or time.monotonic() - self._saved_at >= self.SAVE_INTERVAL:
+                try:
+                    self._save()
+                except Exception as exc:
+                    _LOG.warning("⚠️ Could not persist semantic cache to %s: %s", self.path, exc)
@@ -0,0 +1,150 @@
+# filename: streaming_chat.py
+"""
+Streaming chat
+──────────────
+Token streaming straight from the provider SDK, for prompts that are plain
+conversation and don't need the AutoGen code‑execution loop.
+
+• OpenAI  – `openai.AsyncOpenAI().chat.completions.create(stream=True)`
+• Gemini  – `google.genai` `client.aio.models.generate_content_stream`
+
+Both are already dependencies of the bot; SDK objects are built lazily on the
+first streamed request.
+
+For Gemini the (long, static) system prompt is uploaded once as a
+`cachedContent` resource and referenced by name, so later requests are billed
+the cached‑token rate instead of re‑sending it.  The resource is rebuilt when
+its TTL runs out or the prompt text changes; if creation fails (model without
+caching support, prompt below the minimum size, a transient error…) we send
+it inline and try creating it again after SYSTEM_CACHE_RETRY_SEC.
+OpenAI caches stable prefixes automatically, nothing to do there.
+"""
+
+from __future__ import annotations
+import hashlib, logging, re, time
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+
+# ── basic logging ────────────────────────────────────────────────────────────
+_LOG = logging.getLogger("StreamingChat")
+
+# Words that suggest the user wants the agent to *do* something (run commands,
+# touch files, deploy…) – those must go through AutoGen.
+_ACTION_RE = re.compile(
+    r"\b(run|install|deploy|create|make|build|fix|write|edit|update|delete|remove|"
+    r"clone|commit|push|pull|merge|git|gh|npm|pip|test|file|folder|branch|pr|"
+    r"execute|start|stop|restart|check|open|implement|refactor|add)\b",
+    re.IGNORECASE,
+)
+MAX_CONVERSATIONAL_CHARS = 300
+
+def looks_conversational(text: str) -> bool:
+    """Cheap heuristic: short, no code, no action verbs → safe to answer without tools."""
+    return (
+        len(text) <= MAX_CONVERSATIONAL_CHARS
+        and "```" not in text
+        and not _ACTION_RE.search(text)
+    )
+
+
+_clients: Dict[str, Any] = {}
+
+def _openai_client(api_key: str) -> Any:
+    client = _clients.get("openai")
+    if client is None:
+        from openai import AsyncOpenAI
+        client = _clients["openai"] = AsyncOpenAI(api_key=api_key)
+    return client
+
+def _gemini_client(api_key: str) -> Any:
+    client = _clients.get(api_key)            # one client per key
+    if client is None:
+        from google import genai
+        client = _clients[api_key] = genai.Client(api_key=api_key)
+    return client
+
+
+# ── Gemini explicit prompt cache ─────────────────────────────────────────────
+SYSTEM_CACHE_TTL_SEC = 3600
+SYSTEM_CACHE_RETRY_SEC = 10 * 60      # after a failed create(), send inline this long before retrying
+# (api_key, model, sha256(system)) → (cachedContent name, local expiry)
+_system_caches: Dict[Tuple[str, str, str], Tuple[str, float]] = {}
+# same key → monotonic time creation may be tried again (failures are often transient)
+_cache_retry_at: Dict[Tuple[str, str, str], float] = {}
+
+async def _gemini_system_cache(client: Any, api_key: str, model: str, system_message: str) -> Optional[str]:
+    """Name of a live cachedContent holding `system_message`, or None to send it inline."""
+    key = (api_key, model, hashlib.sha256(system_message.encode("utf-8")).hexdigest())
+    now = time.monotonic()
+    if _cache_retry_at.get(key, 0.0) > now:
+        return None
+    hit = _system_caches.get(key)
+    if hit and hit[1] > now:
+        return hit[0]
+    from google.genai import types
+    try:
+        cache = await client.aio.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                system_instruction=system_message, ttl=f"{SYSTEM_CACHE_TTL_SEC}s",
+            ),
+        )
+    except Exception as exc:
+        _LOG.warning("⚠️ Could not create Gemini prompt cache for %s (%s) – sending system prompt inline for %d s.",
+                     model, exc, SYSTEM_CACHE_RETRY_SEC)
+        _cache_retry_at[key] = now + SYSTEM_CACHE_RETRY_SEC
+        return None
+    _cache_retry_at.pop(key, None)
+    # refresh a minute early so we never reference an expired resource
+    _system_caches[key] = (cache.name, time.monotonic() + SYSTEM_CACHE_TTL_SEC - 60)
+    _LOG.info("✅ Gemini prompt cache %s created for %s", cache.name, model)
+    return cache.name
+
+
+async def stream_completion(
+    prompt: str,
+    system_message: str,
+    *,
+    model: str,
+    api_key: str,
+    use_gemini: bool,
+    history: Sequence[Tuple[str, str]] = (),
+) -> AsyncIterator[str]:
+    """Yield text deltas of a completion as they arrive; `history` holds earlier (user, reply) turns."""
+    if use_gemini:
+        from google.genai import types
+        client = _gemini_client(api_key)
+        cache_name = await _gemini_system_cache(client, api_key, model, system_message)
+        config = (
+            types.GenerateContentConfig(cached_content=cache_name) if cache_name
+            else types.GenerateContentConfig(system_instruction=system_message)
+        )
+        contents = [
+            {"role": role, "parts": [{"text": text}]}
+            for user, reply in history
+            for role, text in (("user", user), ("model", reply))
+        ]
+        contents.append({"role": "user", "parts": [{"text": prompt}]})
+        stream = await client.aio.models.generate_content_stream(
+            model=model, contents=contents, config=config,
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+    else:
+        stream = await _openai_client(api_key).chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_message},
+                *(
+                    {"role": role, "content": text}
+                    for user, reply in history
+                    for role, text in (("user", user), ("assistant", reply))
+                ),
+                {"role": "user", "content": prompt},
+            ],
+            stream=True,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                yield delta
@@ -0,0 +1,26 @@
+# filename: tests/conftest.py
+# The bot's modules import each other as top-level modules (it runs from
+# autogen_agent/), so the tests put that directory on the path the same way.
+import getpass
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+@pytest.fixture
+def bot(monkeypatch):
+    pytest.importorskip("autogen.coding.utils")
+    pytest.importorskip("discord")
+    # the minimum the module checks at import time; nothing connects to Discord
+    monkeypatch.setenv("DISCORD_BOT_TOKEN", "test-token")
+    monkeypatch.setenv("USE_GEMINI", "false")
+    monkeypatch.setenv("OPENAI_API_KEY", "test-key")
+    monkeypatch.setenv("BOT_USER", getpass.getuser())
+    agent_home = str(Path(__file__).resolve().parent.parent)
+    monkeypatch.setenv("AGENT_HOME", agent_home)
+    monkeypatch.setenv("BASH_ENV", agent_home + "/tools.sh")   # the import sets it; restored afterwards
+    return importlib.import_module("autogen_discord_bot")
@@ -0,0 +1,50 @@
+# filename: tests/test_agent_session.py
+import pytest
+
+
+@pytest.fixture
+def session(bot, monkeypatch):
+    monkeypatch.setattr(bot, "FAST_MODEL", "fast-model")
+    return bot._AgentSession()
+
+
+def _script(agent, replies):
+    """Answer from `replies` instead of calling the LLM."""
+    replies = iter(replies)
+
+    def reply(recipient, messages, sender, config):
+        if messages[-1].get("content") == "TERMINATE":    # leave the end of the chat to autogen
+            return False, None
+        return True, next(replies)
+
+    agent.register_reply([object, None], reply, position=0)
+
+
+def _contents(history):
+    return [(m.get("role"), m.get("content")) for m in history]
+
+
+def _assert_shared(session):
+    fast, strong = session.histories(session.assistant_fast), session.histories(session.assistant)
+    for fast_side, strong_side in zip(fast, strong):
+        assert _contents(fast_side) == _contents(strong_side)
+
+
+def test_fast_turn_is_shared_with_the_strong_model(bot, session):
+    _script(session.assistant_fast, ["Paris."])
+    _, last = bot._run_chat(session, "Capital of France?")
+    assert last == "Paris."
+    _assert_shared(session)
+    assert ("assistant", "Paris.") in _contents(session.histories(session.assistant)[1])
+
+
+def test_escalated_turn_replaces_the_fast_attempt(bot, session):
+    _script(session.assistant_fast, ["Paris.", "ESCALATE"])
+    _script(session.assistant, ["A long answer."])
+    bot._run_chat(session, "Capital of France?")
+    _, last = bot._run_chat(session, "Now explain its history.")
+    assert last == "A long answer."
+    _assert_shared(session)
+    strong_view = _contents(session.histories(session.assistant)[1])
+    assert ("assistant", "Paris.") in strong_view            # strong model saw the fast turn
+    assert all("ESCALATE" not in (c or "") for _, c in strong_view)
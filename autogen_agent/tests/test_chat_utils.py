@@ -0,0 +1,74 @@
+# filename: tests/test_chat_utils.py
+from chat_utils import HistoryWindow, chunk_text
+
+
+# ── chunk_text ───────────────────────────────────────────────────────────────
+def test_short_text_is_one_piece():
+    assert list(chunk_text("hello", 100)) == ["hello"]
+
+
+def test_pieces_respect_limit_and_keep_every_word():
+    text = " ".join(f"word{i}" for i in range(2000))
+    pieces = list(chunk_text(text, 200))
+    assert len(pieces) > 1
+    assert all(len(p) <= 200 for p in pieces)
+    assert " ".join(pieces).split() == text.split()
+
+
+def test_open_fence_is_closed_and_reopened_with_its_language():
+    code = "\n".join(f"echo line {i}" for i in range(300))
+    text = f"Intro\n```bash\n{code}\n```\nOutro"
+    pieces = list(chunk_text(text, 300))
+    assert len(pieces) > 2
+    for piece in pieces:
+        assert len(piece) <= 300
+        assert piece.count("```") % 2 == 0, piece
+    assert all(p.startswith("```bash\n") for p in pieces[1:-1])
+
+
+# ── HistoryWindow ────────────────────────────────────────────────────────────
+def _conversation(n_turns):
+    messages = []
+    for i in range(n_turns):
+        messages.append({"role": "user", "content": f"q{i}"})
+        messages.append({"role": "assistant", "content": f"call{i}"})
+        messages.append({"role": "tool", "content": f"result{i}"})
+        messages.append({"role": "assistant", "content": f"a{i}"})
+    return messages
+
+
+def test_window_grows_append_only_below_max():
+    window = HistoryWindow(max_len=50, keep=10)
+    messages = _conversation(5)
+    assert window(messages) == messages
+
+
+def test_window_opens_on_a_user_turn():
+    # the hook runs when the assistant is about to answer, so the history
+    # always ends with the (user-role) message it replies to
+    messages = _conversation(10) + [{"role": "user", "content": "next"}]
+    for keep in range(1, 20):
+        window = HistoryWindow(max_len=40, keep=keep)
+        sent = window(messages)
+        assert sent[0]["role"] == "user", keep
+        assert len(sent) <= keep
+        assert sent == messages[window.start:]
+    assert len(messages) == 41                     # stored history untouched
+
+
+def test_window_keeps_its_start_until_full_again():
+    window = HistoryWindow(max_len=20, keep=8)
+    messages = _conversation(5)
+    window(messages)
+    start = window.start
+    messages += _conversation(1)
+    window(messages)
+    assert window.start == start
+
+
+def test_window_resets_when_history_is_cleared():
+    window = HistoryWindow(max_len=8, keep=4)
+    window(_conversation(3))
+    assert window.start > 0
+    fresh = _conversation(1)
+    assert window(fresh) == fresh
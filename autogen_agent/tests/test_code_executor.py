@@ -0,0 +1,13 @@
+# filename: tests/test_code_executor.py
+import pytest
+
+
+@pytest.mark.parametrize("code", [
+    "echo hello",
+    "exit 0\npip install some-package",      # silence_pip rewrites this line before hashing
+])
+def test_code_file_is_removed_after_execution(bot, tmp_path, code):
+    executor = bot.EnhancedLocalExecutor(work_dir=str(tmp_path), timeout=30)
+    result = executor.execute_code_blocks([bot.CodeBlock(language="bash", code=code)])
+    assert result.exit_code == 0, result.output
+    assert not list(tmp_path.glob("tmp_code_*"))
@@ -0,0 +1,90 @@
+# filename: tests/test_response_cache.py
+import time
+
+import pytest
+
+import response_cache
+from response_cache import ExactResponseCache, SemanticResponseCache
+
+
+# ── ExactResponseCache ───────────────────────────────────────────────────────
+@pytest.fixture
+def exact(tmp_path):
+    pytest.importorskip("diskcache")
+    cache = ExactResponseCache(tmp_path / "exact", expire=1)
+    yield cache
+    cache.close()
+
+
+def test_exact_hit_and_miss(exact):
+    exact.set("mode", "hello", "hi there")
+    assert exact.get("mode", "hello") == "hi there"
+    assert exact.get("mode", "hello!") is None
+    assert exact.get("other-mode", "hello") is None
+
+
+def test_exact_entry_expires(exact):
+    exact.set("mode", "hello", "hi there")
+    time.sleep(1.2)
+    assert exact.get("mode", "hello") is None
+
+
+# ── SemanticResponseCache ────────────────────────────────────────────────────
+@pytest.fixture
+def np():
+    return pytest.importorskip("numpy")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def _unit(np, dim, i):
+    vec = np.zeros((1, dim), dtype="float32")
+    vec[0, i] = 1.0
+    return vec
+
+
+def test_semantic_hit_and_miss(np, tmp_path):
+    cache = SemanticResponseCache(tmp_path / "s.pkl", threshold=0.9)
+    cache.add(_unit(np, 8, 0), "zero")
+    cache.add(_unit(np, 8, 1), "one")
+    assert cache.lookup(_unit(np, 8, 1)) == "one"
+    assert cache.lookup(_unit(np, 8, 2)) is None
+    assert cache.lookup(None) is None
+
+
+def test_semantic_entry_expires(np, tmp_path, clock):
+    cache = SemanticResponseCache(tmp_path / "s.pkl", expire=60)
+    cache.add(_unit(np, 8, 0), "zero")
+    clock[0] += 30
+    assert cache.lookup(_unit(np, 8, 0)) == "zero"
+    clock[0] += 31
+    assert cache.lookup(_unit(np, 8, 0)) is None
+
+
+def test_semantic_evicts_oldest_beyond_max_entries(np, tmp_path):
+    cache = SemanticResponseCache(tmp_path / "s.pkl", max_entries=3)
+    for i in range(5):
+        cache.add(_unit(np, 8, i), str(i))
+    assert cache.lookup(_unit(np, 8, 0)) is None
+    assert [cache.lookup(_unit(np, 8, i)) for i in (2, 3, 4)] == ["2", "3", "4"]
+
+
+def test_semantic_dimension_mismatch_is_a_miss(np, tmp_path):
+    cache = SemanticResponseCache(tmp_path / "s.pkl")
+    cache.add(_unit(np, 8, 0), "eight")
+    assert cache.lookup(_unit(np, 4, 0)) is None   # no ValueError from the matmul
+    cache.add(_unit(np, 4, 0), "four")
+    assert cache.lookup(_unit(np, 4, 0)) == "four"
+
+
+def test_semantic_flush_persists(np, tmp_path):
+    path = tmp_path / "s.pkl"
+    cache = SemanticResponseCache(path)
+    cache.add(_unit(np, 8, 3), "three")
+    cache.flush()
+    assert SemanticResponseCache(path).lookup(_unit(np, 8, 3)) == "three"
@@ -0,0 +1,60 @@
+# filename: tests/test_stream_reply.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+def _http_error(discord):
+    return discord.HTTPException(SimpleNamespace(status=429, reason="Too Many Requests"), "rate limited")
+
+
+class _Message:
+    def __init__(self, discord, fail_edit=False, fail_delete=False):
+        self._discord, self.fail_edit, self.fail_delete = discord, fail_edit, fail_delete
+        self.content, self.deleted = "…", False
+
+    async def edit(self, content):
+        if self.fail_edit:
+            raise _http_error(self._discord)
+        self.content = content
+
+    async def delete(self):
+        if self.fail_delete:
+            raise _http_error(self._discord)
+        self.deleted = True
+
+
+class _Channel:
+    def __init__(self, message):
+        self.message = message
+
+    async def send(self, *_args, **_kw):
+        return self.message
+
+
+@pytest.fixture
+def streaming(bot, monkeypatch):
+    async def fake_stream(*_args, **_kw):
+        yield "Hello "
+        yield "there."
+    monkeypatch.setattr(bot, "stream_completion", fake_stream)
+    return bot
+
+
+def _stream(bot, channel):
+    session = SimpleNamespace(stream_turns=[])
+    return asyncio.run(bot._stream_reply(channel, session, "hi"))
+
+
+def test_stream_reply_posts_the_full_text(streaming):
+    import discord
+    msg = _Message(discord)
+    assert _stream(streaming, _Channel(msg)) == "Hello there."
+    assert msg.content == "Hello there."
+
+
+def test_failed_final_edit_falls_back_instead_of_raising(streaming):
+    import discord
+    msg = _Message(discord, fail_edit=True, fail_delete=True)
+    assert _stream(streaming, _Channel(msg)) is None
@@ -0,0 +1,47 @@
+# filename: tests/test_streaming_chat.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import streaming_chat
+
+
+class _Caches:
+    """Stands in for client.aio.caches; fails the first `failures` creates."""
+    def __init__(self, failures):
+        self.failures, self.calls = failures, 0
+
+    async def create(self, **_kw):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise RuntimeError("503 UNAVAILABLE")
+        return SimpleNamespace(name=f"cachedContents/{self.calls}")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(streaming_chat.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(streaming_chat, "_system_caches", {})
+    monkeypatch.setattr(streaming_chat, "_cache_retry_at", {})
+    return now
+
+
+def _system_cache(client):
+    return asyncio.run(streaming_chat._gemini_system_cache(client, "key", "gemini-test", "system prompt"))
+
+
+def test_failed_prompt_cache_is_retried_after_cooldown(clock):
+    pytest.importorskip("google.genai")
+    caches = _Caches(failures=1)
+    client = SimpleNamespace(aio=SimpleNamespace(caches=caches))
+
+    assert _system_cache(client) is None                 # transient failure → inline
+    assert _system_cache(client) is None                 # still cooling down, no new create()
+    assert caches.calls == 1
+
+    clock[0] += streaming_chat.SYSTEM_CACHE_RETRY_SEC + 1
+    assert _system_cache(client) == "cachedContents/2"   # retried and cached
+    assert _system_cache(client) == "cachedContents/2"
+    assert caches.calls == 2